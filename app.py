@@ -1,9 +1,9 @@
 import os
-import json
-import base64
+import orjson
+import binascii
 import asyncio
 import logging
-import audioop
+import wave
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
 from urllib.parse import parse_qs
@@ -11,6 +11,9 @@ from urllib.parse import parse_qs
 from google import genai
 from google.genai import types
 
+from g711 import ulaw_b64_to_pcm16
+from ws_io import media_message, media_prefix, receive_frame
+
 # ==================================================
 # ENV + LOGGING
 # ==================================================
@@ -23,6 +26,8 @@ logging.basicConfig(
 
 app = FastAPI()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Set DEBUG_DUMP=1 to save the raw Gemini audio of each call to gemini_raw.wav
+DEBUG_DUMP = os.getenv("DEBUG_DUMP") == "1"
 MODEL = "models/gemini-2.5-flash-native-audio-preview-09-2025"
 
 client = genai.Client(
@@ -51,6 +56,9 @@ Always use polite conversational Hindi-English mix (Hinglish).
     )
 )
 
+# Outbound media envelope; only the payload changes between messages
+MEDIA_PREFIX = media_prefix("gemini_stream")
+
 # ==================================================
 # GEMINI HANDLER
 # ==================================================
@@ -61,6 +69,7 @@ class GeminiBridge:
         self.running = True
         self.sample_rate = sample_rate
         self._ratecv_state = None  # for smooth downsampling
+        self._debug_audio = bytearray()  # raw Gemini audio, only kept if DEBUG_DUMP
 
     # Send the first spoken greeting
     async def _send_initial_greeting(self):
@@ -99,27 +108,33 @@ class GeminiBridge:
             if self.session and not self.session.closed:
                 await self.session.close()
                 logging.info("🧹 Gemini session closed.")
+            if DEBUG_DUMP and self._debug_audio:
+                await asyncio.to_thread(self._write_debug_dump)
+
+    def _write_debug_dump(self):
+        with wave.open("gemini_raw.wav", "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(24000)
+            wf.writeframes(self._debug_audio)
+        logging.info(f"💾 Wrote {len(self._debug_audio)} bytes of Gemini audio to gemini_raw.wav")
 
     # Receive audio from Exotel → forward to Gemini
     async def forward_exotel_to_gemini(self):
         try:
             while self.running:
-                msg = await self.exotel_ws.receive_text()
-                data = json.loads(msg)
+                msg = await receive_frame(self.exotel_ws)
+                data = orjson.loads(msg)
                 event = data.get("event")
 
                 if event == "media":
                     try:
-                        audio_b64 = data["media"]["payload"]
-                        mulaw_bytes = base64.b64decode(audio_b64)
-                        # μ-law 8kHz → PCM16 8kHz
-                        pcm16_8k = audioop.ulaw2lin(mulaw_bytes, 2)
-                        # Up-sample 8kHz → 16kHz for Gemini
-                        pcm16_16k, _ = audioop.ratecv(
-                            pcm16_8k, 2, 1, 8000, 16000, None
-                        )
+                        # base64 μ-law 8kHz → PCM16 8kHz
+                        pcm16_8k = ulaw_b64_to_pcm16(data["media"]["payload"])
+                        # Live API only takes PCM input, but resamples it server-side:
+                        # send 8kHz as-is instead of upsampling to twice the bytes
                         await self.session.send(
-                            input={"data": pcm16_16k, "mime_type": "audio/pcm"}
+                            input={"data": pcm16_8k, "mime_type": "audio/pcm;rate=8000"}
                         )
                     except Exception as e:
                         logging.error(f"❌ Error processing Exotel audio: {e}", exc_info=True)
@@ -130,7 +145,7 @@ class GeminiBridge:
                     self.running = False
                     break
 
-                await asyncio.sleep(0.005)
+                await asyncio.sleep(0)
         except WebSocketDisconnect:
             logging.warning("⚠️ Exotel WebSocket disconnected.")
         except Exception as e:
@@ -146,30 +161,25 @@ class GeminiBridge:
             BUFFER_MS = 20
             FRAME_SIZE = int(self.sample_rate * 2 * BUFFER_MS / 1000)
             buffer = bytearray()
+            send_text = self.exotel_ws.send_text
 
+            # session.receive() ends at each turn_complete; loop for the next turn
             while self.running:
-                turn = self.session.receive()
-                async for response in turn:
+                async for response in self.session.receive():
                     # --- Filter out any non-audio events ---
-                    if not hasattr(response, "data") or not response.data:
-                        if getattr(response, "text", None):
-                            logging.info(f"<- Gemini TEXT: {response.text}")
+                    data_part = response.data
+                    if not data_part:
+                        text = response.text
+                        if text:
+                            logging.info(f"<- Gemini TEXT: {text}")
                         continue
 
                     # --- Some Gemini SDKs wrap data in a dict ---
-                    data_part = response.data
                     if isinstance(data_part, dict):
                         if data_part.get("mime_type") != "audio/pcm":
                             logging.debug(f"Skipping non-audio mime_type: {data_part.get('mime_type')}")
                             continue
                         audio_bytes = data_part.get("data", b"")
-                        import wave
-                        with wave.open("gemini_raw.wav", "wb") as wf:
-                            wf.setnchannels(1)
-                            wf.setsampwidth(2)
-                            wf.setframerate(16000)
-                            wf.writeframes(audio_bytes)
-                        break
 
                     elif isinstance(data_part, (bytes, bytearray)):
                         audio_bytes = data_part
@@ -180,16 +190,14 @@ class GeminiBridge:
                     if not audio_bytes:
                         continue
 
-                
+                    if DEBUG_DUMP:
+                        self._debug_audio.extend(audio_bytes)
+
                     pcm16_target = audio_bytes  # no resample
-                    audio_b64 = base64.b64encode(pcm16_target).decode()
-                    await self.exotel_ws.send_text(json.dumps({
-                        "event": "media",
-                        "stream_sid": "gemini_stream",
-                        "media": {"payload": audio_b64}
-                    }))
-
-                await asyncio.sleep(0.002)
+                    audio_b64 = binascii.b2a_base64(pcm16_target, newline=False)
+                    await send_text(media_message(MEDIA_PREFIX, audio_b64))
+
+                await asyncio.sleep(0)
 
         except Exception as e:
             logging.error(f"❌ Error in forward_gemini_to_exotel: {e}", exc_info=True)
@@ -0,0 +1,122 @@
+"""Audio DSP for the Gemini bridges.
+
+Everything here stays int16 end to end: filter taps are Q15 fixed point,
+accumulation is integer and results are saturated back to int16. Don't
+introduce float32 sample buffers on the per-chunk path; converting every
+chunk to float and back costs far more than the filtering itself.
+"""
+import math
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+from numba import njit
+
+# ==================================================
+# POLYPHASE RESAMPLER
+# ==================================================
+# Kaiser-windowed sinc lowpass: flat up to PASSBAND of the lower rate's Nyquist,
+# at least STOPBAND_DB down from that Nyquist on, so nothing folds back into
+# the band. Beta and length follow Kaiser's design formulas.
+STOPBAND_DB = 60.0
+PASSBAND = 0.8
+
+
+@lru_cache(maxsize=None)
+def polyphase_taps(src_rate: int, dst_rate: int) -> Tuple[int, int, np.ndarray]:
+    """Return (L, M, taps) for resampling src_rate -> dst_rate.
+
+    `taps` is an int16 Q15 array of shape (L, K): row p holds the K taps of
+    polyphase branch p, oldest input sample first, each branch having unity
+    DC gain.
+    """
+    g = math.gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    # Band edges in cycles/sample at the upsampled rate
+    nyquist = 0.5 / max(up, down)
+    width = (1.0 - PASSBAND) * nyquist
+    cutoff = (1.0 + PASSBAND) / 2.0 * nyquist
+    beta = 0.1102 * (STOPBAND_DB - 8.7)
+    n_min = math.ceil((STOPBAND_DB - 7.95) / (2.285 * 2.0 * math.pi * width)) + 1
+    k = math.ceil(n_min / up)
+    n = k * up
+    m = np.arange(n) - (n - 1) / 2.0
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * m) * np.kaiser(n, beta) * up
+    taps = np.round(h * 32768.0).clip(-32768, 32767).astype(np.int16)
+    # h[p + j*L] is branch p's tap for input sample i - j; store it reversed
+    # so the kernel walks both taps and samples forwards
+    taps = np.ascontiguousarray(taps.reshape(k, up).T[:, ::-1])
+    # The kernel accumulates in int32; a full-scale input must not overflow it
+    assert np.abs(taps.astype(np.int64)).sum(axis=1).max() * 32768 < 2**31
+    return up, down, taps
+
+
+@njit(nogil=True, cache=True)
+def resample_polyphase(x, work, taps, up, down, phase, out):
+    """Filter int16 `x` by up/down into `out`; returns the number of samples written.
+
+    `work` holds the K-1 history samples followed by room for `x`, and
+    `phase[0]` the position of the next output on the upsampled time axis.
+    Both are updated in place for the next chunk. Runs without the GIL, so
+    bridges resampling from worker threads don't serialize on each other.
+    """
+    k = taps.shape[1]
+    hist = k - 1
+    n_in = x.shape[0]
+    work[hist:hist + n_in] = x
+    t0 = phase[0]
+    t_end = n_in * up
+    n_out = (t_end - t0 + down - 1) // down if t_end > t0 else 0
+    t = t0
+    for n in range(n_out):
+        # Slicing first lets LLVM vectorize the dot product (no index wraparound)
+        branch = taps[t % up]
+        window = work[t // up:t // up + k]
+        acc = np.int32(0)
+        for j in range(k):
+            acc += np.int32(branch[j]) * np.int32(window[j])
+        acc = (acc + 16384) >> 15
+        out[n] = min(max(acc, -32768), 32767)
+        t += down
+    phase[0] = t - t_end
+    # Keep the last K-1 input samples as history for the next chunk
+    for i in range(hist):
+        work[i] = work[n_in + i]
+    return n_out
+
+
+class Resampler:
+    """Streaming resampler for one stream of 16-bit little-endian mono PCM.
+
+    Holds the filter history and work buffers for that stream, so use one
+    instance per stream and direction.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, max_chunk: int = 4800):
+        self.up, self.down, self.taps = polyphase_taps(src_rate, dst_rate)
+        self._hist = self.taps.shape[1] - 1
+        self._phase = np.zeros(1, dtype=np.int64)
+        self._work = np.zeros(self._hist + max_chunk, dtype=np.int16)
+        self._out = np.empty(max_chunk * self.up // self.down + 1, dtype=np.int16)
+
+    def process(self, pcm: bytes) -> bytes:
+        x = np.frombuffer(pcm, dtype=np.int16)
+        if len(x) > len(self._work) - self._hist:
+            # Chunk larger than any seen so far: grow, keeping the history
+            work = np.zeros(self._hist + len(x), dtype=np.int16)
+            work[:self._hist] = self._work[:self._hist]
+            self._work = work
+            self._out = np.empty(len(x) * self.up // self.down + 1, dtype=np.int16)
+        n = resample_polyphase(x, self._work, self.taps, self.up, self.down, self._phase, self._out)
+        return self._out[:n].tobytes()
+
+    def reset(self):
+        """Forget the history, e.g. when the audio being resampled is discarded."""
+        self._work[:self._hist] = 0
+        self._phase[0] = 0
+
+
+# Design the filters for the rate pairs the bridges use and compile the kernel
+# up front so the first audio chunk does not pay for it.
+for _src, _dst in ((24000, 16000), (24000, 8000)):
+    Resampler(_src, _dst).process(b"\x00\x00" * 480)
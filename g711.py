@@ -0,0 +1,27 @@
+"""G.711 codec helpers. numpy only, so importing this stays cheap."""
+import binascii
+
+import numpy as np
+
+# ==================================================
+# G.711 MU-LAW
+# ==================================================
+def _build_ulaw2lin() -> np.ndarray:
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    magnitude = ((((u & 0x0F) << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+# mu-law byte -> int16 sample, same values as audioop.ulaw2lin(..., 2)
+ULAW2LIN = _build_ulaw2lin()
+
+
+def ulaw_to_pcm16(mulaw: bytes) -> bytes:
+    """Decode G.711 mu-law bytes to 16-bit little-endian PCM."""
+    return ULAW2LIN[np.frombuffer(mulaw, dtype=np.uint8)].tobytes()
+
+
+def ulaw_b64_to_pcm16(payload) -> bytes:
+    """Decode a base64 mu-law media payload (str or bytes) straight to PCM16."""
+    return ulaw_to_pcm16(binascii.a2b_base64(payload))
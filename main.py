@@ -1,10 +1,14 @@
 import os
-import json
+import orjson
 import base64
+import binascii
 import asyncio
 import logging
-import audioop
-from typing import Optional, Tuple
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
@@ -12,7 +16,9 @@ from urllib.parse import parse_qs
 
 from google import genai
 from google.genai import types
-from google.genai.types import AudioTranscriptionConfig
+
+from audio_dsp import Resampler
+from ws_io import media_message, media_prefix, receive_frame
 
 # ==================================================
 # ENV + LOGGING
@@ -24,7 +30,16 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-app = FastAPI()
+# Workers for resampling unusually large downlink chunks, kept apart from the
+# loop's default executor so they can't hold up getaddrinfo for new calls
+RESAMPLE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="resample")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    RESAMPLE_POOL.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan)
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
@@ -56,21 +71,24 @@ Always use polite conversational Hindi-English mix (Hinglish).
 IMPORTANT: You must respond with AUDIO speech only. Do not include any text thoughts or explanations.
 Just speak your response naturally in Hinglish.
 """)]
-    ),
-    output_audio_transcription=AudioTranscriptionConfig()
+    )
 )
 
-# ==================================================
-# Helpers
-# ==================================================
-def resample_pcm16(
-    pcm: bytes, src_rate: int, dst_rate: int, state: Optional[bytes] = None
-) -> Tuple[bytes, Optional[bytes]]:
-    """Resample 16-bit little-endian mono PCM."""
-    if src_rate == dst_rate:
-        return pcm, state
-    out, new_state = audioop.ratecv(pcm, 2, 1, src_rate, dst_rate, state)
-    return out, new_state
+# Sent to the client on barge-in so it drops queued playback
+INTERRUPT_MSG = '{"event":"interrupt"}'
+
+# Control markers passed from the Gemini receiver to the Exotel sender
+TX_TURN_COMPLETE = object()
+TX_INTERRUPT = object()
+
+# Downlink chunks at least this big (400ms at 24kHz, ~100us to resample) are
+# resampled in RESAMPLE_POOL; the nogil kernel then runs off the event loop
+RESAMPLE_OFFLOAD_BYTES = 24000 * 2 * 400 // 1000
+
+# Audio chunks the sender may fall behind by before the oldest are dropped
+TX_MAX_AUDIO = 16
+# Report dropped chunks at most this often (seconds)
+TX_DROP_LOG_INTERVAL = 5.0
 
 # ==================================================
 # GEMINI HANDLER
@@ -83,10 +101,33 @@ class GeminiBridge:
         self.session = None
         self.running = True
         self.exotel_stream_sid: Optional[str] = None
-        self.exotel_rate: int = hinted_sample_rate
-        self._to_16k_state = None
-        self._to_client_state = None
+        self._set_exotel_rate(hinted_sample_rate)
         self._current_chunks = 0
+        # Outbound scratch buffer: 2s of client audio, reused for the whole call
+        self._tx_buf = bytearray(hinted_sample_rate * 2 * 2)
+        self._tx_len = 0
+        # Media envelope around the payload, built once the stream sid is known
+        self._tx_prefix: Optional[bytes] = None
+        # Gemini receiver -> Exotel sender: audio bytes, TX_* markers, None to stop.
+        # Only audio counts towards TX_MAX_AUDIO; markers are never dropped.
+        self._tx_items: deque = deque()
+        self._tx_audio_queued = 0
+        self._tx_ready = asyncio.Event()
+        self._tx_dropped = 0
+        self._tx_drop_logged_at = float("-inf")
+        self._sender_done = False
+
+    def _set_exotel_rate(self, rate: int):
+        self.exotel_rate: int = rate
+        # Gemini takes PCM16 at the client's rate as-is but always speaks 24kHz
+        self._uplink_mime = f"audio/pcm;rate={rate}"
+        # Skip downlink resampling when the client matches (a new rate also
+        # means fresh filter history)
+        self._to_client: Optional[Resampler] = Resampler(24000, rate) if rate != 24000 else None
+        # Downlink packet sizes in bytes: whole 20ms frames, 60ms min, 100ms max
+        self._frame20 = rate * 20 // 1000 * 2
+        self._min_flush = self._frame20 * 3
+        self._max_flush = self._frame20 * 5
 
     async def _send_initial_greeting(self):
         initial_text = (
@@ -112,6 +153,7 @@ class GeminiBridge:
                 await asyncio.gather(
                     self.forward_exotel_to_gemini(),
                     self.forward_gemini_to_exotel(),
+                    self._exotel_sender(),
                     return_exceptions=True
                 )
 
@@ -130,8 +172,8 @@ class GeminiBridge:
         logging.info("🎙️ Starting to forward client audio to Gemini...")
         try:
             while self.running:
-                raw = await self.exotel_ws.receive_text()
-                data = json.loads(raw)
+                raw = await receive_frame(self.exotel_ws)
+                data = orjson.loads(raw)
                 event = data.get("event")
 
                 if event == "connected":
@@ -142,7 +184,8 @@ class GeminiBridge:
                     self.exotel_stream_sid = data.get("stream_sid") or data.get("start", {}).get("stream_sid")
                     sr = data.get("start", {}).get("media_format", {}).get("sample_rate")
                     if isinstance(sr, int) and sr > 0:
-                        self.exotel_rate = sr
+                        self._set_exotel_rate(sr)
+                    self._tx_prefix = None
                     logging.info(f"🎧 Stream start: sid={self.exotel_stream_sid}, rate={self.exotel_rate} Hz")
                     continue
 
@@ -154,11 +197,8 @@ class GeminiBridge:
                     try:
                         b64 = data["media"]["payload"]
                         pcm_exotel = base64.b64decode(b64)
-                        pcm_16k, self._to_16k_state = resample_pcm16(
-                            pcm_exotel, self.exotel_rate, 16000, self._to_16k_state
-                        )
                         await self.session.send_realtime_input(
-                            audio={"data": pcm_16k, "mime_type": "audio/pcm;rate=16000"}
+                            audio={"data": pcm_exotel, "mime_type": self._uplink_mime}
                         )
                         self._current_chunks += 1
                     except Exception as e:
@@ -195,7 +235,7 @@ class GeminiBridge:
             self.running = False
 
     async def forward_gemini_to_exotel(self):
-        """Receive Gemini audio (24kHz) and stream to client (16kHz) with minimal latency."""
+        """Receive Gemini audio (24kHz) and hand it to the Exotel sender via the tx queue."""
         try:
             logging.info("👂 Listening for Gemini responses...")
             
@@ -209,43 +249,31 @@ class GeminiBridge:
                         model_turn = server_content.model_turn
                         turn_complete = server_content.turn_complete
                         interrupted = server_content.interrupted
-                        output_transcription = server_content.output_transcription
                         audio_bytes = None
                         
-                        # Handle interruption - stop playing immediately
+                        # Handle interruption - drop queued audio and stop playing immediately
                         if interrupted:
                             logging.info("🚫 Interrupted - user started speaking")
-                            await self.exotel_ws.send_text(json.dumps({"event": "interrupt"}))
+                            self._tx_items.clear()
+                            self._tx_audio_queued = 0
+                            self._enqueue_tx(TX_INTERRUPT)
                             continue
                         
                         if model_turn:
                             for part in model_turn.parts:
-                                if hasattr(part, 'inline_data') and part.inline_data is not None:
-                                    audio_bytes = part.inline_data.data
+                                inline_data = part.inline_data
+                                if inline_data is not None:
+                                    audio_bytes = inline_data.data
                                     break
-                                if hasattr(part, 'text') and part.text:
+                                if part.text:
                                     logging.info(f"<- TEXT: {part.text}")
-                        
-                        if output_transcription and hasattr(output_transcription, 'text'):
-                            text = output_transcription.text
-                            if text and isinstance(text, str) and text.strip():
-                                logging.info(f"<- TRANSCRIPT: {text}")
-                        
-                        if turn_complete:
-                            logging.info("✅ Turn complete")
 
-                        if not audio_bytes:
-                            continue
+                        if audio_bytes:
+                            self._enqueue_tx(audio_bytes)
 
-                        # ZERO-LATENCY: Stream immediately without buffering
-                        # Gemini outputs 24kHz, resample to client rate (16kHz)
-                        pcm_client, self._to_client_state = resample_pcm16(
-                            audio_bytes, 24000, self.exotel_rate, self._to_client_state
-                        )
-                        
-                        # Send immediately without buffer
-                        payload = base64.b64encode(pcm_client).decode("ascii")
-                        await self._send_exotel_media(payload)
+                        if turn_complete:
+                            logging.info("✅ Turn complete")
+                            self._enqueue_tx(TX_TURN_COMPLETE)
 
                         await asyncio.sleep(0)
                 
@@ -260,16 +288,111 @@ class GeminiBridge:
         finally:
             logging.info("🔚 Gemini→Exotel loop finished")
             self.running = False
+            self._enqueue_tx(None)
+
+    def _enqueue_tx(self, item):
+        """Queue an item for the sender, dropping the oldest audio chunk if it's falling behind."""
+        if self._sender_done:
+            return
+        items = self._tx_items
+        if isinstance(item, bytes):
+            if self._tx_audio_queued >= TX_MAX_AUDIO:
+                # Only audio may go; markers carry turn ends and barge-ins.
+                # Markers are rare, so the oldest chunk is at or near the front.
+                for i, queued in enumerate(items):
+                    if isinstance(queued, bytes):
+                        del items[i]
+                        break
+                self._tx_dropped += 1
+                now = time.monotonic()
+                if now - self._tx_drop_logged_at >= TX_DROP_LOG_INTERVAL:
+                    logging.warning(
+                        f"⚠️ Exotel sender falling behind, dropped {self._tx_dropped} oldest audio chunk(s)"
+                    )
+                    self._tx_dropped = 0
+                    self._tx_drop_logged_at = now
+            else:
+                self._tx_audio_queued += 1
+        items.append(item)
+        self._tx_ready.set()
+
+    async def _exotel_sender(self):
+        """Resample queued Gemini audio to the client rate and send it in 60ms packets."""
+        send_media = self._send_exotel_media
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not self._tx_items:
+                    self._tx_ready.clear()
+                    await self._tx_ready.wait()
+                    continue
+                item = self._tx_items.popleft()
+                if item is None:
+                    break
+
+                if item is TX_INTERRUPT:
+                    self._tx_len = 0
+                    # Don't let the discarded audio bleed into the next response
+                    if self._to_client is not None:
+                        self._to_client.reset()
+                    await self.exotel_ws.send_text(INTERRUPT_MSG)
+                    continue
+
+                if item is TX_TURN_COMPLETE:
+                    # Don't hold the tail of the turn back
+                    if self._tx_len:
+                        with memoryview(self._tx_buf) as view:
+                            payload = binascii.b2a_base64(view[:self._tx_len], newline=False)
+                        self._tx_len = 0
+                        await send_media(payload)
+                    continue
+
+                self._tx_audio_queued -= 1
+                # Gemini outputs 24kHz, resample to client rate (16kHz).
+                # A pool hop adds ~35us, as much as resampling a typical
+                # chunk takes, so only very large chunks leave the loop.
+                if self._to_client is None:
+                    pcm_client = item
+                elif len(item) >= RESAMPLE_OFFLOAD_BYTES:
+                    pcm_client = await loop.run_in_executor(RESAMPLE_POOL, self._to_client.process, item)
+                else:
+                    pcm_client = self._to_client.process(item)
+                end = self._tx_len + len(pcm_client)
+                if end > len(self._tx_buf):
+                    self._tx_buf.extend(bytes(end - len(self._tx_buf)))
+                self._tx_buf[self._tx_len:end] = pcm_client
+                self._tx_len = end
+
+                # Coalesce 20ms frames: one media event per >=60ms,
+                # capped at 100ms so a packet never holds too much audio
+                frame20 = self._frame20
+                min_flush = self._min_flush
+                max_flush = self._max_flush
+                sent = 0
+                with memoryview(self._tx_buf) as view:
+                    while self._tx_len - sent >= min_flush:
+                        flush_size = min((self._tx_len - sent) // frame20 * frame20, max_flush)
+                        payload = binascii.b2a_base64(view[sent:sent + flush_size], newline=False)
+                        sent += flush_size
+                        await send_media(payload)
+                    # Move the unsent remainder (<60ms) to the front
+                    self._tx_len -= sent
+                    view[:self._tx_len] = view[sent:sent + self._tx_len]
+        except WebSocketDisconnect:
+            logging.warning("⚠️ WebSocket disconnected")
+        except Exception as e:
+            logging.error(f"❌ Error in _exotel_sender: {e}", exc_info=True)
+        finally:
+            logging.info("🔚 Exotel sender finished")
+            self._sender_done = True
+            self.running = False
 
-    async def _send_exotel_media(self, payload_b64: str):
-        if not self.exotel_stream_sid:
-            self.exotel_stream_sid = "default_stream"
-        msg = {
-            "event": "media",
-            "stream_sid": self.exotel_stream_sid,
-            "media": {"payload": payload_b64}
-        }
-        await self.exotel_ws.send_text(json.dumps(msg))
+    async def _send_exotel_media(self, payload_b64: bytes):
+        if self._tx_prefix is None:
+            if not self.exotel_stream_sid:
+                self.exotel_stream_sid = "default_stream"
+            self._tx_prefix = media_prefix(self.exotel_stream_sid)
+        await self.exotel_ws.send_text(media_message(self._tx_prefix, payload_b64))
 
 @app.websocket("/ws/audio")
 async def exotel_audio(websocket: WebSocket):
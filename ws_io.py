@@ -0,0 +1,40 @@
+"""WebSocket framing shared by the Gemini bridges."""
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+# ==================================================
+# INBOUND
+# ==================================================
+async def receive_frame(ws: WebSocket):
+    """Next non-empty inbound frame: bytes for binary frames, str for text.
+
+    Binary frames reach orjson without a UTF-8 decode. Text frames (what the
+    browser client and Exotel send today) arrive already decoded by the ASGI
+    server, so for them this is no cheaper than receive_text().
+    """
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        data = message.get("bytes")
+        if data is None:
+            data = message.get("text")
+        if data:
+            return data
+
+
+# ==================================================
+# OUTBOUND
+# ==================================================
+MEDIA_SUFFIX = b'"}}'
+
+
+def media_prefix(stream_sid: str) -> bytes:
+    """Media event JSON up to the opening quote of the payload, for one stream."""
+    return b'{"event":"media","stream_sid":' + orjson.dumps(stream_sid) + b',"media":{"payload":"'
+
+
+def media_message(prefix: bytes, payload_b64: bytes) -> str:
+    """Media event text frame for a base64 payload from media_prefix()."""
+    # base64 needs no JSON escaping, so splice the payload in as-is
+    return (prefix + payload_b64 + MEDIA_SUFFIX).decode()